@@ -1,6 +1,4 @@
 import paho.mqtt.client as mqtt
-import random
-import time
 import json
 from datetime import datetime
 
@@ -34,7 +32,7 @@ def on_message(client, userdata, msg):
 
 
 # Initialize the MQTT client
-client = mqtt.Client()
+client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
 
 # Set the callback functions
 client.on_message = on_message
@@ -44,10 +42,5 @@ client.connect(BROKER, PORT, 60)
 
 client.subscribe(TOPIC_SUBSCRIBE)
 
-# Start the MQTT loop in a non-blocking way
-client.loop_start()
-
-while True:
-        # Sleep for a random time between 10-15 seconds
-        sleep_time = random.randint(10,15)
-        time.sleep(sleep_time)
+# Run the MQTT network loop on the main thread until interrupted
+client.loop_forever()
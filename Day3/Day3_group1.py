@@ -1,6 +1,4 @@
 import paho.mqtt.client as mqtt
-import time
-import random
 import json
 from datetime import datetime
 
@@ -40,14 +38,10 @@ def on_message(client, userdata, msg):
         print("Error processing message:", e)
 
 # Setup MQTT client
-client = mqtt.Client()
+client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
 client.on_message = on_message
 client.connect(BROKER_IP, 1883, 60)
 client.subscribe(SOURCE_TOPIC)
-client.loop_start()
-
-# Main loop
-while True:
-    sleep_time = random.randint(10, 15)  # Sleep between 10–15s
-    time.sleep(sleep_time)
 
+# Main loop: paho handles network traffic and callbacks until interrupted
+client.loop_forever()
@@ -0,0 +1,235 @@
+"""
+Raspberry Pi - Shared MQTT Publisher Base
+- MQTT connection, callbacks and reconnects
+- select() loop over the serial ports and the MQTT socket
+- Publish skeleton; each publisher builds its own payload
+- Spectral sensor parsing and averaging for the publishers that read it
+"""
+
+import orjson
+import select
+from math import isfinite
+import time
+import paho.mqtt.client as mqtt
+import sys
+
+# Longest partial line kept while waiting for its newline
+MAX_LINE_LENGTH = 1024  # bytes
+
+# Spectral channels averaged over each publish interval
+SPECTRUM_CHANNELS = ('A', 'B', 'C', 'D', 'E', 'F')
+
+def quantize(value, scale=100):
+    """Round to 1/scale (half away from zero) with integer math, cheaper than round()"""
+    if not isfinite(value):
+        return value  # int() raises on NaN/inf; orjson writes them as null
+    if value >= 0:
+        return int(value * scale + 0.5) / scale
+    return int(value * scale - 0.5) / scale
+
+class BasePublisher:
+    """MQTT plumbing and main loop shared by the Raspberry Pi publishers"""
+    # Set by each publisher from its configuration section
+    title = "Water Quality MQTT Publisher"
+    broker = None
+    port = 1883
+    topic = None
+    client_id = None
+    interval = 10  # seconds
+    qos = 1
+    keepalive = 60  # seconds
+    
+    def setup_mqtt(self):
+        """Initialize MQTT client"""
+        self.mqtt_client = mqtt.Client(client_id=self.client_id, callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+        self.mqtt_client.on_connect = self.on_mqtt_connect
+        self.mqtt_client.on_disconnect = self.on_mqtt_disconnect
+        
+        try:
+            # No loop_start(): run() drives the network I/O from its select() loop
+            self.mqtt_client.connect(self.broker, self.port, self.keepalive)
+            print(f"✓ Connecting to MQTT broker at {self.broker}:{self.port}")
+        except Exception as e:
+            print(f"✗ Error connecting to MQTT broker: {e}")
+            sys.exit(1)
+    
+    def reconnect_mqtt(self):
+        """Try to re-open the broker connection after it dropped"""
+        try:
+            self.mqtt_client.reconnect()
+            print("✓ Reconnecting to MQTT broker")
+        except OSError as e:
+            print(f"✗ Error reconnecting to MQTT broker: {e}")
+    
+    def mqtt_sockets(self):
+        """Return the MQTT socket to watch for reading, and for writing while paho has queued bytes"""
+        sock = self.mqtt_client.socket()
+        if sock is None:
+            return [], []
+        return [sock], ([sock] if self.mqtt_client.want_write() else [])
+    
+    def on_mqtt_connect(self, client, userdata, flags, rc, properties=None):
+        """Callback when connected to MQTT broker"""
+        if rc == 0:
+            print("✓ Connected to MQTT broker")
+        else:
+            print(f"✗ Failed to connect to MQTT broker, code: {rc}")
+    
+    def on_mqtt_disconnect(self, client, userdata, flags, rc, properties=None):
+        """Callback when disconnected from MQTT broker"""
+        print("⚠ Disconnected from MQTT broker")
+    
+    def read_lines(self, ser, buf):
+        """Drain whatever bytes are waiting on a serial port and return complete lines"""
+        waiting = ser.in_waiting
+        if waiting:
+            buf += ser.read(waiting)
+        
+        # Keep any trailing partial line in the buffer for the next read
+        end = buf.rfind(b'\n')
+        if end < 0:
+            if len(buf) > MAX_LINE_LENGTH:
+                buf.clear()  # Line noise without newlines; drop it
+            return []
+        lines = buf[:end].split(b'\n')
+        del buf[:end + 1]
+        return lines
+    
+    def serial_ports(self):
+        """Serial ports the main loop waits on"""
+        return []
+    
+    def read_ready(self, readable):
+        """Read from whichever serial ports select() reported readable"""
+    
+    def build_payload(self):
+        """Return (topic, message, status) for this interval, or None to skip publishing"""
+        # Publishers build their payload dict once in __init__ and only rewrite its values here;
+        # timestamps go in as datetime objects, since orjson writes the ISO 8601 string itself
+        raise NotImplementedError
+    
+    def published(self):
+        """Clear per-interval state after a successful publish"""
+    
+    def publish_data(self):
+        """Build this interval's payload and publish it to the MQTT broker"""
+        built = self.build_payload()
+        if built is None:
+            return
+        topic, message, status = built
+        
+        try:
+            result = self.mqtt_client.publish(
+                topic,
+                message,
+                qos=self.qos,
+                retain=False
+            )
+            
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                print(f"✓ Published: {status}")
+                self.published()
+            else:
+                print(f"✗ Publish failed: {result.rc}")
+        except Exception as e:
+            print(f"✗ Error publishing: {e}")
+    
+    def run(self):
+        """Main publishing loop"""
+        print("=" * 60)
+        print(self.title)
+        print("=" * 60)
+        print(f"Publishing to topic: {self.topic}")
+        print(f"Interval: {self.interval} seconds")
+        print("Press Ctrl+C to stop\n")
+        
+        serial_ports = self.serial_ports()
+        last_publish = 0
+        
+        try:
+            while True:
+                # Block until a sensor or the broker sends data, or the next publish is due;
+                # waking at least every keepalive/2 lets loop_misc() ping in time with long intervals
+                timeout = max(0.0, min(self.interval - (time.time() - last_publish), self.keepalive / 2))
+                mqtt_read, mqtt_write = self.mqtt_sockets()
+                readable, writable, _ = select.select(serial_ports + mqtt_read, mqtt_write, [], timeout)
+                
+                if readable:
+                    self.read_ready(readable)
+                
+                # MQTT network I/O: acks and pings in, queued packets out, keepalive
+                if mqtt_read and mqtt_read[0] in readable:
+                    self.mqtt_client.loop_read()
+                if writable:
+                    self.mqtt_client.loop_write()
+                self.mqtt_client.loop_misc()
+                
+                # Publish data at specified interval
+                current_time = time.time()
+                if current_time - last_publish >= self.interval:
+                    if self.mqtt_client.socket() is None:
+                        self.reconnect_mqtt()
+                    self.publish_data()
+                    last_publish = current_time
+        
+        except KeyboardInterrupt:
+            print("\n\nShutting down publisher...")
+            self.mqtt_client.disconnect()
+            for ser in serial_ports:
+                ser.close()
+            print("Goodbye!")
+
+class SpectrumPublisher(BasePublisher):
+    """BasePublisher plus running sums of the AS7265X spectral sensor's readings"""
+    
+    # Name shown on the spectral board's status and error lines
+    spectrum_source = "Spectral sensor"
+    
+    def reset_spectrum(self):
+        """Clear the spectral running sums accumulated since the last publish"""
+        self.spectrum_count = 0
+        self.channel_sums = dict.fromkeys(SPECTRUM_CHANNELS, 0.0)
+        self.spectrum_sum = 0.0
+    
+    def parse_spectrum_line(self, raw):
+        """Parse one line of spectral sensor data straight from the raw bytes and add it to the sums"""
+        try:
+            line = raw.strip()
+            # Expected format: {"A":123.45,"B":234.56,...,"spectrum":180.23}
+            if line[:1] == b'{':
+                # Status/error messages are only printed, so skip parsing them
+                if b'"status"' in line or b'"error"' in line:
+                    print(f"ℹ️  {self.spectrum_source}: {line.decode('utf-8', 'replace')}")
+                    return False
+                
+                data = orjson.loads(line)
+                
+                # Check if we have spectral data with channels
+                if 'A' in data and 'spectrum' in data:
+                    # Read all seven values before touching the sums, so a bad line adds nothing
+                    values = [float(data[channel]) for channel in SPECTRUM_CHANNELS]
+                    spectrum = float(data['spectrum'])
+                    if not isfinite(spectrum) or not all(map(isfinite, values)):
+                        raise ValueError("non-finite value")
+                    
+                    sums = self.channel_sums
+                    for channel, value in zip(SPECTRUM_CHANNELS, values):
+                        sums[channel] += value
+                    self.spectrum_sum += spectrum
+                    self.spectrum_count += 1
+                    print(f"📊 Spectrum Reading #{self.spectrum_count}: Avg={spectrum:.2f}")
+                    return True
+        except orjson.JSONDecodeError as e:
+            print(f"Error reading {self.spectrum_source}: {e}")
+        except (KeyError, TypeError, ValueError) as e:
+            # A missing channel or a non-numeric value: skip the line rather than crash the loop
+            print(f"Error reading {self.spectrum_source}: bad reading ({type(e).__name__}: {e})")
+        return False
+    
+    def average_spectrum(self, channels):
+        """Write each channel's interval average into channels and return the overall average"""
+        num_readings = self.spectrum_count
+        sums = self.channel_sums
+        for channel in SPECTRUM_CHANNELS:
+            channels[channel] = quantize(sums[channel] / num_readings)
+        return self.spectrum_sum / num_readings
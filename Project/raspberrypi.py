@@ -8,10 +8,12 @@ Raspberry Pi - Water Quality MQTT Publisher
 
 import serial
 import time
-import json
-import paho.mqtt.client as mqtt
+import orjson
 from datetime import datetime
+from math import isfinite
 import sys
+import zlib
+from base_publisher import SpectrumPublisher, quantize
 
 # Serial Configuration
 ARDUINO_PORT = '/dev/ttyUSB0'  # Arduino with turbidity sensor
@@ -27,10 +29,37 @@ MQTT_CLIENT_ID = "group1_raspberry_pi"
 # Publish interval
 PUBLISH_INTERVAL = 10  # seconds
 
-class WaterQualityPublisher:
+# Interval averages sent per MQTT message; above 1 the message is {"samples": [...]}
+PUBLISH_BATCH = 1
+
+# Batches at least this large are zlib-compressed and sent to MQTT_TOPIC + "/zlib"
+COMPRESS_MIN_BYTES = 200
+
+class WaterQualityPublisher(SpectrumPublisher):
+    # Configuration picked up by BasePublisher
+    title = "Water Quality MQTT Publisher Started"
+    broker = MQTT_BROKER
+    port = MQTT_PORT
+    topic = MQTT_TOPIC
+    client_id = MQTT_CLIENT_ID
+    interval = PUBLISH_INTERVAL
+    spectrum_source = "SparkFun"
+    
     def __init__(self):
-        self.turbidity_readings = []  # Store multiple turbidity readings for averaging
-        self.spectrum_readings = []  # Store multiple spectrum readings for averaging
+        self.reset_readings()  # Running sums for averaging, no per-reading storage
+        self.arduino_buf = bytearray()  # Partial lines carried between serial reads
+        self.sparkfun_buf = bytearray()
+        self.batched_payloads = []  # Serialized interval averages waiting for a batch publish
+        
+        self.turbidity_section = {"voltage": 0.0, "readings_count": 0}
+        self.spectrum_channels = {"A": 0.0, "B": 0.0, "C": 0.0, "D": 0.0, "E": 0.0, "F": 0.0}
+        self.spectrum_section = {"channels": self.spectrum_channels, "average": 0.0, "readings_count": 0}
+        self.payload = {
+            "timestamp": None,
+            "location": "raspberry_pi_1",
+            "turbidity_sensor": None,
+            "spectrum_sensor": None
+        }
         
         # Initialize serial connections to both boards
         self.setup_serial()
@@ -38,11 +67,17 @@ class WaterQualityPublisher:
         # Initialize MQTT client
         self.setup_mqtt()
     
+    def reset_readings(self):
+        """Clear the running sums accumulated since the last publish"""
+        self.turbidity_count = 0
+        self.voltage_sum = 0.0
+        self.reset_spectrum()
+    
     def setup_serial(self):
         """Connect to Arduino and SparkFun RedBoard"""
         # Connect to Arduino (Turbidity Sensor)
         try:
-            self.arduino_ser = serial.Serial(ARDUINO_PORT, BAUD_RATE, timeout=2)
+            self.arduino_ser = serial.Serial(ARDUINO_PORT, BAUD_RATE, timeout=0)
             time.sleep(2)  # Wait for Arduino to reset
             print(f"✓ Connected to Arduino on {ARDUINO_PORT}")
         except serial.SerialException as e:
@@ -51,225 +86,155 @@ class WaterQualityPublisher:
         
         # Connect to SparkFun RedBoard (Spectral Sensor)
         try:
-            self.sparkfun_ser = serial.Serial(SPARKFUN_PORT, BAUD_RATE, timeout=2)
+            self.sparkfun_ser = serial.Serial(SPARKFUN_PORT, BAUD_RATE, timeout=0)
             time.sleep(2)  # Wait for SparkFun to reset
             print(f"✓ Connected to SparkFun RedBoard on {SPARKFUN_PORT}")
         except serial.SerialException as e:
             print(f"✗ Error connecting to SparkFun RedBoard: {e}")
             sys.exit(1)
     
-
+    def serial_ports(self):
+        """Both boards are watched by the main loop"""
+        return [self.arduino_ser, self.sparkfun_ser]
     
-    def setup_mqtt(self):
-        """Initialize MQTT client"""
-        self.mqtt_client = mqtt.Client(client_id=MQTT_CLIENT_ID, callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
-        self.mqtt_client.on_connect = self.on_mqtt_connect
-        self.mqtt_client.on_disconnect = self.on_mqtt_disconnect
-        
-        try:
-            self.mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
-            self.mqtt_client.loop_start()
-            print(f"✓ Connecting to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
-        except Exception as e:
-            print(f"✗ Error connecting to MQTT broker: {e}")
-            sys.exit(1)
-    
-    def on_mqtt_connect(self, client, userdata, flags, rc, properties=None):
-        """Callback when connected to MQTT broker"""
-        if rc == 0:
-            print("✓ Connected to MQTT broker")
-        else:
-            print(f"✗ Failed to connect to MQTT broker, code: {rc}")
-    
-    def on_mqtt_disconnect(self, client, userdata, rc, properties=None):
-        """Callback when disconnected from MQTT broker"""
-        print("⚠ Disconnected from MQTT broker")
+    def read_ready(self, readable):
+        """Read from whichever boards have data waiting"""
+        if self.arduino_ser in readable:
+            self.read_arduino_turbidity()
+        if self.sparkfun_ser in readable:
+            self.read_sparkfun_spectrum()
     
     def read_arduino_turbidity(self):
-        """Read turbidity data from Arduino and accumulate readings"""
-        try:
-            if self.arduino_ser.in_waiting > 0:
-                line = self.arduino_ser.readline().decode('utf-8').strip()
-                
-                if not line:
-                    return False
-                
-                # Try to parse JSON format: {"raw":512,"voltage":2.5,"turbidity":100.5}
-                if line.startswith('{'):
-                    try:
-                        data = json.loads(line)
-                        
-                        # Check if this is status message
-                        if 'status' in data:
-                            print(f"ℹ️  Arduino: {data}")
-                            return False
-                        
-                        # Check if we have turbidity data
-                        if 'turbidity' in data:
-                            self.turbidity_readings.append(data)
-                            print(f"💧 Turbidity Reading #{len(self.turbidity_readings)}: {data['turbidity']:.2f} NTU (V={data['voltage']:.2f})")
-                            return True
-                    except json.JSONDecodeError:
-                        pass  # Fall through to try parsing as plain voltage
-                
-                # Try to parse as plain voltage value: "2.500"
-                try:
-                    voltage = float(line)
-                    
-                    data = {
-                        'voltage': voltage
-                    }
-                    
-                    self.turbidity_readings.append(data)
-                    print(f"💧 Turbidity Voltage Reading #{len(self.turbidity_readings)}: {voltage:.3f}V")
-                    return True
-                    
-                except ValueError:
-                    # Not a valid number, ignore
-                    print(f"🔍 Arduino (ignored): {line}")
-                    return False
-                    
-        except UnicodeDecodeError as e:
-            print(f"Error decoding Arduino data: {e}")
-        return False
+        """Read all complete lines from the Arduino and accumulate turbidity readings"""
+        got_reading = False
+        for raw in self.read_lines(self.arduino_ser, self.arduino_buf):
+            if self.parse_turbidity_line(raw):
+                got_reading = True
+        return got_reading
     
-    def read_sparkfun_spectrum(self):
-        """Read spectral sensor data from SparkFun RedBoard and accumulate readings"""
-        try:
-            if self.sparkfun_ser.in_waiting > 0:
-                line = self.sparkfun_ser.readline().decode('utf-8').strip()
-                # Expected format: {"A":123.45,"B":234.56,...,"spectrum":180.23}
-                if line.startswith('{'):
-                    data = json.loads(line)
-                    
-                    # Check if this is status/error message
-                    if 'status' in data or 'error' in data:
-                        print(f"ℹ️  SparkFun: {data}")
-                        return False
-                    
-                    # Check if we have spectral data with channels
-                    if 'A' in data and 'spectrum' in data:
-                        self.spectrum_readings.append(data)
-                        print(f"📊 Spectrum Reading #{len(self.spectrum_readings)}: Avg={data['spectrum']:.2f}")
+    def parse_turbidity_line(self, raw):
+        """Parse one line of turbidity data from the Arduino straight from the raw bytes"""
+        line = raw.strip()
+        
+        if not line:
+            return False
+        
+        # Try to parse JSON format: {"raw":512,"voltage":2.5,"turbidity":100.5}
+        if line[:1] == b'{':
+            # Status messages are only printed, so skip parsing them
+            if b'"status"' in line:
+                print(f"ℹ️  Arduino: {line.decode('utf-8', 'replace')}")
+                return False
+            
+            try:
+                data = orjson.loads(line)
+                
+                # Check if we have turbidity data
+                if 'turbidity' in data:
+                    # Both values are checked before the sum changes, so a bad line adds nothing
+                    voltage = float(data['voltage'])
+                    turbidity = float(data['turbidity'])
+                    if isfinite(voltage):
+                        self.voltage_sum += voltage
+                        self.turbidity_count += 1
+                        print(f"💧 Turbidity Reading #{self.turbidity_count}: {turbidity:.2f} NTU (V={voltage:.2f})")
                         return True
-        except (json.JSONDecodeError, UnicodeDecodeError) as e:
-            print(f"Error reading SparkFun: {e}")
-        return False
+            except (orjson.JSONDecodeError, KeyError, TypeError, ValueError):
+                pass  # Fall through to try parsing as plain voltage
+        
+        # Try to parse as plain voltage value: "2.500" (float() accepts the bytes as-is)
+        try:
+            voltage = float(line)
+            if not isfinite(voltage):
+                # float() also accepts "nan" and "inf", which would poison the interval average
+                raise ValueError
+            
+            self.voltage_sum += voltage
+            self.turbidity_count += 1
+            print(f"💧 Turbidity Voltage Reading #{self.turbidity_count}: {voltage:.3f}V")
+            return True
+            
+        except ValueError:
+            # Not a valid number, ignore
+            print(f"🔍 Arduino (ignored): {line.decode('utf-8', 'replace')}")
+            return False
     
-
+    def read_sparkfun_spectrum(self):
+        """Read all complete lines from the SparkFun RedBoard and accumulate spectrum readings"""
+        got_reading = False
+        for raw in self.read_lines(self.sparkfun_ser, self.sparkfun_buf):
+            if self.parse_spectrum_line(raw):
+                got_reading = True
+        return got_reading
     
-    def publish_data(self):
-        """Publish sensor data to MQTT broker"""
+    def build_payload(self):
+        """Average this interval's readings into the MQTT message"""
         # Check if we have at least one sensor with data
-        if not self.turbidity_readings and not self.spectrum_readings:
+        if not self.turbidity_count and not self.spectrum_count:
             print("⏳ Waiting for sensor data...")
-            return
+            return None
         
-        payload = {
-            "timestamp": datetime.now().isoformat(),
-            "location": "raspberry_pi_1"
-        }
+        payload = self.payload
+        payload["timestamp"] = datetime.now()
         
         status_msg = []
         
         # Add turbidity data if available
-        if self.turbidity_readings:
-            num_turbidity = len(self.turbidity_readings)
-            avg_voltage = sum(r['voltage'] for r in self
-                              .turbidity_readings) / num_turbidity
+        if self.turbidity_count:
+            num_turbidity = self.turbidity_count
+            avg_voltage = self.voltage_sum / num_turbidity
             
-            payload["turbidity_sensor"] = {
-                "voltage": round(avg_voltage, 3),
-                "readings_count": num_turbidity
-            }
+            turbidity_section = self.turbidity_section
+            turbidity_section["voltage"] = quantize(avg_voltage, 1000)
+            turbidity_section["readings_count"] = num_turbidity
+            payload["turbidity_sensor"] = turbidity_section
             status_msg.append(f"Turbidity Voltage={avg_voltage:.3f}V ({num_turbidity} readings)")
         else:
             payload["turbidity_sensor"] = None
             status_msg.append("Turbidity=N/A")
         
         # Add spectrum data if available
-        if self.spectrum_readings:
-            num_spectrum = len(self.spectrum_readings)
-            avg_channels = {
-                'A': sum(r['A'] for r in self.spectrum_readings) / num_spectrum,
-                'B': sum(r['B'] for r in self.spectrum_readings) / num_spectrum,
-                'C': sum(r['C'] for r in self.spectrum_readings) / num_spectrum,
-                'D': sum(r['D'] for r in self.spectrum_readings) / num_spectrum,
-                'E': sum(r['E'] for r in self.spectrum_readings) / num_spectrum,
-                'F': sum(r['F'] for r in self.spectrum_readings) / num_spectrum
-            }
-            avg_spectrum = sum(r['spectrum'] for r in self.spectrum_readings) / num_spectrum
+        if self.spectrum_count:
+            num_spectrum = self.spectrum_count
+            avg_spectrum = self.average_spectrum(self.spectrum_channels)
             
-            payload["spectrum_sensor"] = {
-                "channels": {
-                    "A": round(avg_channels['A'], 2),
-                    "B": round(avg_channels['B'], 2),
-                    "C": round(avg_channels['C'], 2),
-                    "D": round(avg_channels['D'], 2),
-                    "E": round(avg_channels['E'], 2),
-                    "F": round(avg_channels['F'], 2)
-                },
-                "average": round(avg_spectrum, 2),
-                "readings_count": num_spectrum
-            }
+            spectrum_section = self.spectrum_section
+            spectrum_section["average"] = quantize(avg_spectrum)
+            spectrum_section["readings_count"] = num_spectrum
+            payload["spectrum_sensor"] = spectrum_section
             status_msg.append(f"Spectrum={avg_spectrum:.2f} ({num_spectrum} readings)")
         else:
             payload["spectrum_sensor"] = None
             status_msg.append("Spectrum=N/A")
         
-        try:
-            result = self.mqtt_client.publish(
-                MQTT_TOPIC,
-                json.dumps(payload),
-                qos=1,
-                retain=False
-            )
-            
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                print(f"✓ Published: {', '.join(status_msg)}")
-                # Clear readings after successful publish
-                self.turbidity_readings = []
-                self.spectrum_readings = []
-            else:
-                print(f"✗ Publish failed: {result.rc}")
-        except Exception as e:
-            print(f"✗ Error publishing: {e}")
-    
-    def run(self):
-        """Main publishing loop"""
-        print("=" * 60)
-        print("Water Quality MQTT Publisher Started")
-        print("=" * 60)
-        print(f"Publishing to topic: {MQTT_TOPIC}")
-        print(f"Interval: {PUBLISH_INTERVAL} seconds")
-        print("Press Ctrl+C to stop\n")
+        message = orjson.dumps(payload)
+        batch = self.batched_payloads
+        if PUBLISH_BATCH > 1:
+            # Hold this interval's average until PUBLISH_BATCH of them can share one message
+            batch.append(message)
+            if len(batch) > PUBLISH_BATCH:
+                # Failed publishes leave the batch full; drop the oldest rather than grow without bound
+                del batch[:-PUBLISH_BATCH]
+            self.reset_readings()
+            if len(batch) < PUBLISH_BATCH:
+                print(f"📦 Batched {len(batch)}/{PUBLISH_BATCH}: {', '.join(status_msg)}")
+                return None
+            message = b'{"samples":[' + b','.join(batch) + b']}'
+            status_msg.insert(0, f"{len(batch)} samples")
         
-        last_publish = 0
+        topic = MQTT_TOPIC
+        if PUBLISH_BATCH > 1 and len(message) >= COMPRESS_MIN_BYTES:
+            # Repeated keys and digits compress well; level 1 keeps the Pi's CPU cost low
+            message = zlib.compress(message, 1)
+            topic = MQTT_TOPIC + "/zlib"
         
-        try:
-            while True:
-                # Continuously read from both Arduino and SparkFun
-                self.read_arduino_turbidity()
-                self.read_sparkfun_spectrum()
-                
-                # Publish data at specified interval
-                current_time = time.time()
-                if current_time - last_publish >= PUBLISH_INTERVAL:
-                    self.publish_data()
-                    last_publish = current_time
-                
-                time.sleep(0.1)  # Small delay to prevent CPU overuse
-                
-        except KeyboardInterrupt:
-            print("\n\nShutting down publisher...")
-            self.mqtt_client.loop_stop()
-            self.mqtt_client.disconnect()
-            if self.arduino_ser:
-                self.arduino_ser.close()
-            if self.sparkfun_ser:
-                self.sparkfun_ser.close()
-            print("Goodbye!")
+        return topic, message, ', '.join(status_msg)
+    
+    def published(self):
+        """Clear readings after successful publish"""
+        self.reset_readings()
+        self.batched_payloads.clear()
 
 if __name__ == "__main__":
     publisher = WaterQualityPublisher()
-    publisher.run()
\ No newline at end of file
+    publisher.run()
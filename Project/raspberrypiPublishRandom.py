@@ -5,117 +5,83 @@ Raspberry Pi - Water Quality MQTT Publisher (Random Data Mode)
 - Publishes data to MQTT broker
 """
 
-import time
-import json
+import orjson
 import random
-import paho.mqtt.client as mqtt
 from datetime import datetime
-import sys
+from base_publisher import BasePublisher
 
 # MQTT Configuration
 MQTT_BROKER = "192.168.1.103"  # MQTT broker IP
 MQTT_PORT = 1883
 MQTT_TOPIC = "Group1_FilterProject"
 MQTT_CLIENT_ID = "group1_raspberry_pi"
+MQTT_QOS = 0  # Test data: loss is acceptable, so skip the PUBACK round trip
 
 # Publish interval
 PUBLISH_INTERVAL = 10  # seconds
 
-class WaterQualityPublisher:
+# Random readings generated per refill, so fast load-test intervals don't pay per publish
+RANDOM_POOL_SIZE = 1024
+
+# Private generator's bound random(); uniform(a, b) is spelled a + (b - a) * r() inline
+_random = random.Random().random
+
+class WaterQualityPublisher(BasePublisher):
+    # Configuration picked up by BasePublisher
+    title = "Water Quality MQTT Publisher (Random Data Mode)"
+    broker = MQTT_BROKER
+    port = MQTT_PORT
+    topic = MQTT_TOPIC
+    client_id = MQTT_CLIENT_ID
+    interval = PUBLISH_INTERVAL
+    qos = MQTT_QOS
+    
     def __init__(self):
+        self.payload = {
+            "timestamp": None,
+            "turbidity_sensor": 0.0,
+            "spectrum_sensor": 0.0,
+            "location": "raspberry_pi_1"
+        }
+        self.refill_random_pools()
+        
         # Initialize MQTT client
         self.setup_mqtt()
         print("✓ Random data generator initialized")
     
-
-    
-    def setup_mqtt(self):
-        """Initialize MQTT client"""
-        self.mqtt_client = mqtt.Client(client_id=MQTT_CLIENT_ID, callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
-        self.mqtt_client.on_connect = self.on_mqtt_connect
-        self.mqtt_client.on_disconnect = self.on_mqtt_disconnect
-        
-        try:
-            self.mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
-            self.mqtt_client.loop_start()
-            print(f"✓ Connecting to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
-        except Exception as e:
-            print(f"✗ Error connecting to MQTT broker: {e}")
-            sys.exit(1)
-    
-    def on_mqtt_connect(self, client, userdata, flags, rc, properties=None):
-        """Callback when connected to MQTT broker"""
-        if rc == 0:
-            print("✓ Connected to MQTT broker")
-        else:
-            print(f"✗ Failed to connect to MQTT broker, code: {rc}")
-    
-    def on_mqtt_disconnect(self, client, userdata, rc, properties=None):
-        """Callback when disconnected from MQTT broker"""
-        print("⚠ Disconnected from MQTT broker")
+    def refill_random_pools(self):
+        """Pre-generate a pool of rounded random readings"""
+        r = _random
+        # Turbidity values in the 0-10 NTU range
+        self.turbidity_pool = [round(0.5 + 9.5 * r(), 2) for _ in range(RANDOM_POOL_SIZE)]
+        # Spectrum values in the 0-1000 range
+        self.spectrum_pool = [round(50.0 + 950.0 * r(), 2) for _ in range(RANDOM_POOL_SIZE)]
+        self.pool_index = 0
     
     def generate_random_data(self):
-        """Generate random sensor data for testing"""
-        # Generate random turbidity value (0-10 NTU range)
-        turbidity = round(random.uniform(0.5, 10.0), 2)
-        
-        # Generate random spectrum value (0-1000 range)
-        spectrum = round(random.uniform(50.0, 1000.0), 2)
+        """Take the next random sensor reading from the pre-generated pools"""
+        i = self.pool_index
+        if i == RANDOM_POOL_SIZE:
+            self.refill_random_pools()
+            i = 0
+        self.pool_index = i + 1
         
-        return turbidity, spectrum
+        return self.turbidity_pool[i], self.spectrum_pool[i]
     
 
     
-    def publish_data(self):
-        """Generate and publish random sensor data to MQTT broker"""
+    def build_payload(self):
+        """Generate random sensor data into the MQTT message"""
         # Generate random sensor values
         turbidity, spectrum = self.generate_random_data()
         
-        payload = {
-            "timestamp": datetime.now().isoformat(),
-            "turbidity_sensor": turbidity,
-            "spectrum_sensor": spectrum,
-            "location": "raspberry_pi_1"
-        }
-        
-        try:
-            result = self.mqtt_client.publish(
-                MQTT_TOPIC,
-                json.dumps(payload),
-                qos=1,
-                retain=False
-            )
-            
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                print(f"✓ Published: Turbidity={turbidity:.2f} NTU, Spectrum={spectrum:.2f}")
-            else:
-                print(f"✗ Publish failed: {result.rc}")
-        except Exception as e:
-            print(f"✗ Error publishing: {e}")
-    
-    def run(self):
-        """Main publishing loop"""
-        print("=" * 60)
-        print("Water Quality MQTT Publisher (Random Data Mode)")
-        print("=" * 60)
-        print(f"Publishing to topic: {MQTT_TOPIC}")
-        print(f"Interval: {PUBLISH_INTERVAL} seconds")
-        print("Press Ctrl+C to stop\n")
+        payload = self.payload
+        payload["timestamp"] = datetime.now()
+        payload["turbidity_sensor"] = turbidity
+        payload["spectrum_sensor"] = spectrum
         
-        try:
-            while True:
-                # Generate and publish random data
-                self.publish_data()
-                
-                # Wait for next publish interval
-                time.sleep(PUBLISH_INTERVAL)
-                
-        except KeyboardInterrupt:
-            print("\n\nShutting down publisher...")
-            self.mqtt_client.loop_stop()
-            self.mqtt_client.disconnect()
-            print("Goodbye!")
+        return MQTT_TOPIC, orjson.dumps(payload), f"Turbidity={turbidity:.2f} NTU, Spectrum={spectrum:.2f}"
 
 if __name__ == "__main__":
     publisher = WaterQualityPublisher()
-    publisher.run()
\ No newline at end of file
+    publisher.run()
@@ -5,10 +5,14 @@ Simulates good and bad water quality payloads for testing
 """
 
 import paho.mqtt.client as mqtt
-import json
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+import orjson
 from datetime import datetime
 import time
+import socket
 import sys
+import threading
 
 # MQTT Configuration (same as computeNode.py)
 MQTT_BROKER = "192.168.1.103"
@@ -16,85 +20,167 @@ MQTT_PORT = 1883
 MQTT_TOPIC = "group1/water_quality"
 MQTT_CLIENT_ID = "simulator_client"
 
+# MQTT v5 topic alias: after the first publish only a 2-byte alias replaces the topic
+# string. Needs a v5 broker that advertises Topic Alias Maximum (Mosquitto 2.x does).
+USE_TOPIC_ALIAS = False
+
+# Longest wait for the broker's CONNACK before giving up
+CONNECT_TIMEOUT = 10  # seconds
+
+# Socket send buffer for the broker connection; 0 leaves it to kernel autotuning
+SOCKET_SNDBUF = 0  # bytes
+
+# Messages sent by "flood" mode when no count is given
+FLOOD_COUNT = 1000
+
+USAGE = "\n".join([
+    "Usage: python3 simulate_sensor_data.py [--quiet] [good|bad|moderate|flood [count [clients]]]",
+    "   count >= 0 (default 1000), clients >= 1 (default 1)",
+    "   Or run without arguments for interactive mode",
+])
+
+# Canned test readings: name -> (heading, turbidity, turbidity note, light intensity, light note)
+CANNED_PAYLOADS = {
+    # Turbidity below threshold (5.0), light within range (50-800)
+    "good": ("GOOD water quality payload", 2.5, "(threshold: 5.0)", 300.0, "(range: 50-800)"),
+    # Severely turbid, low light transmission (triggers alert)
+    "bad": ("BAD water quality payload (should trigger alert)", 12.5, "(threshold: 5.0) ⚠️", 35.0, "(min: 50) ⚠️"),
+    # Above threshold but not severe, light within acceptable range
+    "moderate": ("MODERATELY BAD water quality payload", 7.2, "(threshold: 5.0) ⚠️", 150.0, "(OK)"),
+}
+
 class SensorSimulator:
-    def __init__(self):
-        self.mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, MQTT_CLIENT_ID)
+    def __init__(self, qos=1, client_id=MQTT_CLIENT_ID, quiet=False):
+        self.qos = qos  # QoS 0 skips the PUBACK round trip per message
+        self.quiet = quiet  # Only report failures from sends and floods
+        self.connected = threading.Event()  # Set by on_connect once the broker accepts us
+        self.topic_alias = None  # PUBLISH properties carrying the alias, once the broker allows it
+        self.connection_count = 0  # Bumped by on_connect; an alias only holds on its own connection
+        self.alias_connection = None  # connection_count when the full topic went out with the alias
+        self.mqtt_client = mqtt.Client(
+            client_id=client_id,
+            callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+            protocol=mqtt.MQTTv5 if USE_TOPIC_ALIAS else mqtt.MQTTv311
+        )
         self.mqtt_client.on_connect = self.on_connect
         
+        self.payload = {
+            "timestamp": None,
+            "turbidity": 0.0,
+            "light_intensity": 0.0,
+            "location": "test_simulator"
+        }
+        
         try:
             print(f"Connecting to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}...")
-            self.mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
+            # The handshake runs on paho's loop thread; wait for CONNACK rather than a fixed sleep
+            self.mqtt_client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
             self.mqtt_client.loop_start()
-            time.sleep(2)  # Wait for connection
         except Exception as e:
             print(f"✗ Error connecting to MQTT broker: {e}")
             sys.exit(1)
+        
+        if not self.connected.wait(CONNECT_TIMEOUT):
+            print(f"✗ Error connecting to MQTT broker: no answer within {CONNECT_TIMEOUT}s")
+            self.mqtt_client.loop_stop()
+            sys.exit(1)
     
-    def on_connect(self, client, userdata, flags, rc):
+    def on_connect(self, client, userdata, flags, rc, properties=None):
         if rc == 0:
             print(f"✓ Connected to MQTT broker")
+            # Small JSON payloads go out immediately instead of waiting on Nagle's algorithm
+            sock = client.socket()
+            if sock is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                if SOCKET_SNDBUF > 0:
+                    # A fixed size switches off the kernel's send buffer autotuning for this socket
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_SNDBUF)
+            
+            # Aliases are per connection, so the topic must be sent in full again
+            self.topic_alias = None
+            if USE_TOPIC_ALIAS and getattr(properties, "TopicAliasMaximum", 0) >= 1:
+                alias = Properties(PacketTypes.PUBLISH)
+                alias.TopicAlias = 1
+                self.topic_alias = alias
+            self.connection_count += 1  # Last, so publish() never pairs the new count with an old alias
+            
+            self.connected.set()
         else:
             print(f"✗ Failed to connect, return code: {rc}")
     
-    def send_good_payload(self):
-        """Send a payload with good water quality"""
-        payload = {
-            "timestamp": datetime.now().isoformat(),
-            "turbidity": 2.5,  # Below threshold (5.0)
-            "light_intensity": 300.0,  # Within range (50-800)
-            "location": "test_simulator"
-        }
-        
-        print("\n📤 Sending GOOD water quality payload:")
-        print(f"   Turbidity: {payload['turbidity']} NTU (threshold: 5.0)")
-        print(f"   Light: {payload['light_intensity']} (range: 50-800)")
-        
-        result = self.mqtt_client.publish(MQTT_TOPIC, json.dumps(payload), qos=1)
-        
+    def publish(self, message):
+        """Publish to MQTT_TOPIC, sending only the topic alias at QoS 0 once the broker has learned it"""
+        # on_connect runs on paho's thread: read the count before the alias it replaces
+        connection = self.connection_count
+        alias = self.topic_alias
+        if alias is None:
+            return self.mqtt_client.publish(MQTT_TOPIC, message, qos=self.qos)
+        # QoS 1/2 messages may be resent on a new connection, where the alias is unknown,
+        # so they always carry the full topic
+        if self.alias_connection == connection and self.qos == 0:
+            return self.mqtt_client.publish("", message, qos=self.qos, properties=alias)
+        result = self.mqtt_client.publish(MQTT_TOPIC, message, qos=self.qos, properties=alias)
         if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            print("   ✓ Published successfully")
-        else:
-            print(f"   ✗ Publish failed: {result.rc}")
+            # Recorded against the connection read above, so a reconnect in between leaves it stale
+            self.alias_connection = connection
+        return result
     
-    def send_bad_payload(self):
-        """Send a payload with poor water quality (triggers alert)"""
-        payload = {
-            "timestamp": datetime.now().isoformat(),
-            "turbidity": 12.5,  # Above threshold (5.0) - severely turbid
-            "light_intensity": 35.0,  # Below minimum (50) - low light transmission
-            "location": "test_simulator"
-        }
-        
-        print("\n📤 Sending BAD water quality payload (should trigger alert):")
-        print(f"   Turbidity: {payload['turbidity']} NTU (threshold: 5.0) ⚠️")
-        print(f"   Light: {payload['light_intensity']} (min: 50) ⚠️")
-        
-        result = self.mqtt_client.publish(MQTT_TOPIC, json.dumps(payload), qos=1)
+    def build_payload(self, turbidity, light_intensity):
+        """Fill the reusable payload with a fresh timestamp and the given readings"""
+        payload = self.payload
+        payload["timestamp"] = datetime.now()
+        payload["turbidity"] = turbidity
+        payload["light_intensity"] = light_intensity
+        return payload
+    
+    def send_payload(self, heading, turbidity, turbidity_note, light_intensity, light_note):
+        """Publish one reading and report the outcome"""
+        payload = self.build_payload(turbidity, light_intensity)
+        result = self.publish(orjson.dumps(payload))
         
-        if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            print("   ✓ Published successfully")
-        else:
-            print(f"   ✗ Publish failed: {result.rc}")
+        published = result.rc == mqtt.MQTT_ERR_SUCCESS
+        if published and self.quiet:
+            return
+        # One write per send rather than one per line
+        print("\n".join([
+            f"\n📤 Sending {heading}:",
+            f"   Turbidity: {turbidity} NTU {turbidity_note}".rstrip(),
+            f"   Light: {light_intensity} {light_note}".rstrip(),
+            "   ✓ Published successfully" if published else f"   ✗ Publish failed: {result.rc}",
+        ]))
     
-    def send_moderately_bad_payload(self):
-        """Send a payload with moderately bad water quality"""
-        payload = {
-            "timestamp": datetime.now().isoformat(),
-            "turbidity": 7.2,  # Above threshold but not severe
-            "light_intensity": 150.0,  # Within acceptable range
-            "location": "test_simulator"
-        }
+    def send_canned(self, name):
+        """Send one of the canned payloads: good, bad or moderate"""
+        self.send_payload(*CANNED_PAYLOADS[name])
+    
+    def send_batch(self, count):
+        """Publish the GOOD payload count times back to back for load testing"""
+        _, turbidity, _, light_intensity, _ = CANNED_PAYLOADS["good"]
+        publish = self.publish
+        message = None
+        last_ms = -1
+        infos = []
         
-        print("\n📤 Sending MODERATELY BAD water quality payload:")
-        print(f"   Turbidity: {payload['turbidity']} NTU (threshold: 5.0) ⚠️")
-        print(f"   Light: {payload['light_intensity']} (OK)")
+        if not self.quiet:
+            print(f"\n📤 Flooding {count} payloads at QoS {self.qos}...")
+        start = time.time()
         
-        result = self.mqtt_client.publish(MQTT_TOPIC, json.dumps(payload), qos=1)
+        # Queue everything first; paho's loop thread drains the socket meanwhile.
+        # The payload is re-stamped and re-serialized at most once per millisecond.
+        for _ in range(count):
+            now_ms = int(time.time() * 1000)
+            if now_ms != last_ms:
+                last_ms = now_ms
+                message = orjson.dumps(self.build_payload(turbidity, light_intensity))
+            infos.append(publish(message))
+        queued = [info for info in infos if info.rc == mqtt.MQTT_ERR_SUCCESS]
+        if queued:
+            queued[-1].wait_for_publish(timeout=30)
         
-        if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            print("   ✓ Published successfully")
-        else:
-            print(f"   ✗ Publish failed: {result.rc}")
+        elapsed = time.time() - start
+        if self.quiet and len(queued) == count:
+            return
+        print(f"   ✓ Published {len(queued)}/{count} in {elapsed:.2f}s ({len(queued) / max(elapsed, 1e-6):.0f} msg/s)")
     
     def interactive_menu(self):
         """Interactive menu for testing"""
@@ -105,26 +191,33 @@ class SensorSimulator:
         print(f"Topic: {MQTT_TOPIC}")
         print("\nMake sure computeNode.py is running to receive messages!")
         
+        # Menu text is written in one go and choices are looked up, not chained through if/elif
+        menu = "\n".join([
+            "",
+            "-" * 60,
+            "Options:",
+            "  1. Send GOOD payload (clean water)",
+            "  2. Send BAD payload (dirty water - triggers alert)",
+            "  3. Send MODERATELY BAD payload",
+            "  4. Send custom payload",
+            "  5. Exit",
+            "-" * 60,
+        ])
+        actions = {
+            "1": lambda: self.send_canned("good"),
+            "2": lambda: self.send_canned("bad"),
+            "3": lambda: self.send_canned("moderate"),
+            "4": self.send_custom_payload,
+        }
+        
         while True:
-            print("\n" + "-" * 60)
-            print("Options:")
-            print("  1. Send GOOD payload (clean water)")
-            print("  2. Send BAD payload (dirty water - triggers alert)")
-            print("  3. Send MODERATELY BAD payload")
-            print("  4. Send custom payload")
-            print("  5. Exit")
-            print("-" * 60)
+            print(menu)
             
             choice = input("\nEnter your choice (1-5): ").strip()
             
-            if choice == "1":
-                self.send_good_payload()
-            elif choice == "2":
-                self.send_bad_payload()
-            elif choice == "3":
-                self.send_moderately_bad_payload()
-            elif choice == "4":
-                self.send_custom_payload()
+            action = actions.get(choice)
+            if action is not None:
+                action()
             elif choice == "5":
                 print("\nShutting down simulator...")
                 self.mqtt_client.loop_stop()
@@ -141,51 +234,81 @@ class SensorSimulator:
             turbidity = float(input("   Enter turbidity (NTU, e.g., 3.5): "))
             light = float(input("   Enter light intensity (e.g., 200): "))
             
-            payload = {
-                "timestamp": datetime.now().isoformat(),
-                "turbidity": turbidity,
-                "light_intensity": light,
-                "location": "test_simulator"
-            }
-            
-            print(f"\n📤 Sending custom payload:")
-            print(f"   Turbidity: {turbidity} NTU")
-            print(f"   Light: {light}")
+            self.send_payload("custom payload", turbidity, "", light, "")
             
-            result = self.mqtt_client.publish(MQTT_TOPIC, json.dumps(payload), qos=1)
-            
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                print("   ✓ Published successfully")
-            else:
-                print(f"   ✗ Publish failed: {result.rc}")
-                
         except ValueError:
             print("   ❌ Invalid input, please enter numeric values")
         except Exception as e:
             print(f"   ❌ Error: {e}")
 
-def main():
-    if len(sys.argv) > 1:
-        # Command line mode
-        simulator = SensorSimulator()
-        
-        if sys.argv[1] == "good":
-            simulator.send_good_payload()
-        elif sys.argv[1] == "bad":
-            simulator.send_bad_payload()
-        elif sys.argv[1] == "moderate":
-            simulator.send_moderately_bad_payload()
-        else:
-            print("Usage: python3 simulate_sensor_data.py [good|bad|moderate]")
-            print("   Or run without arguments for interactive mode")
-        
-        time.sleep(1)
+def flood_parallel(count, clients, quiet=False):
+    """Split a flood across several simulators, each with its own connection and client ID"""
+    simulators = [SensorSimulator(qos=0, client_id=f"{MQTT_CLIENT_ID}_{i}", quiet=quiet) for i in range(clients)]
+    threads = [
+        threading.Thread(target=simulator.send_batch, args=(count // clients + (i < count % clients),))
+        for i, simulator in enumerate(simulators)
+    ]
+    
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    print(f"\n✓ {clients} clients published {count} in {elapsed:.2f}s ({count / max(elapsed, 1e-6):.0f} msg/s)")
+    
+    for simulator in simulators:
         simulator.mqtt_client.loop_stop()
         simulator.mqtt_client.disconnect()
-    else:
+
+def parse_flood_args(args):
+    """Return (count, clients) from the arguments after "flood", or None if they aren't valid"""
+    try:
+        count = int(args[0]) if args else FLOOD_COUNT
+        clients = int(args[1]) if len(args) > 1 else 1
+    except ValueError:
+        return None
+    if count < 0 or clients < 1:
+        return None
+    return count, clients
+
+def main():
+    # --quiet may appear anywhere and silences per-send output
+    quiet = "--quiet" in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != "--quiet"]
+    
+    if not args:
         # Interactive mode
         simulator = SensorSimulator()
         simulator.interactive_menu()
+        return
+    
+    # Arguments are checked before connecting, so bad input only prints the usage
+    if args[0] == "flood":
+        flood = parse_flood_args(args[1:])
+        if flood is None:
+            print(USAGE)
+            return
+        count, clients = flood
+        if clients > 1:
+            # Parallel flood: flood <count> <clients>
+            flood_parallel(count, clients, quiet)
+            return
+    elif args[0] not in CANNED_PAYLOADS:
+        print(USAGE)
+        return
+    
+    # Command line mode; flood mode publishes at QoS 0
+    simulator = SensorSimulator(qos=0 if args[0] == "flood" else 1, quiet=quiet)
+    
+    if args[0] == "flood":
+        simulator.send_batch(count)
+    else:
+        simulator.send_canned(args[0])
+    
+    time.sleep(1)
+    simulator.mqtt_client.loop_stop()
+    simulator.mqtt_client.disconnect()
 
 if __name__ == "__main__":
     main()
@@ -7,14 +7,21 @@ WebSocket Bridge Server - Water Quality Data
 """
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 import paho.mqtt.client as mqtt
-import json
+import orjson
 import asyncio
+import logging
+import logging.handlers
 import os
+import queue
+import socket
+import time
+import zlib
 from collections import deque
 from datetime import datetime
-from typing import Any, Deque, Dict, Optional, Set
+from typing import Any, Deque, Dict, Optional, Tuple
 import uvicorn
 from asyncio import AbstractEventLoop
 
@@ -22,13 +29,54 @@ from asyncio import AbstractEventLoop
 MQTT_BROKER = os.environ.get('MQTT_BROKER', '192.168.1.103')
 MQTT_PORT = int(os.environ.get('MQTT_PORT', 1883))
 MQTT_TOPIC = os.environ.get('MQTT_TOPIC', 'group1/water_quality')
+# zlib-compressed sample batches from raspberrypi.py; empty disables it. A wildcard
+# MQTT_TOPIC has no "/zlib" sibling to derive, so set this explicitly in that case
+MQTT_ZLIB_TOPIC = os.environ.get(
+    'MQTT_ZLIB_TOPIC', '' if '#' in MQTT_TOPIC or '+' in MQTT_TOPIC else MQTT_TOPIC + "/zlib"
+)
+# Largest batch a compressed payload may inflate to; anything bigger is dropped unread
+MAX_INFLATED_BYTES = int(os.environ.get('MAX_INFLATED_BYTES', 1048576))
 MQTT_CLIENT_ID = os.environ.get('MQTT_CLIENT_ID', 'websocket_bridge')
+# QoS 0: the bridge keeps only the freshest readings anyway, so skip the PUBACK per message
+MQTT_QOS = int(os.environ.get('MQTT_QOS', 0))
+# Socket receive buffer, so bursts wait in the kernel rather than at the broker
+MQTT_RCVBUF = int(os.environ.get('MQTT_RCVBUF', 0))  # bytes; 0 leaves it to kernel autotuning
 
 # History configuration
 HISTORY_LIMIT = int(os.environ.get('HISTORY_LIMIT', 100))
 
-# FastAPI app
-app = FastAPI(title="Water Quality WebSocket Bridge")
+# Broadcast configuration: MQTT messages wait in a bounded queue and are sent in batches
+BROADCAST_QUEUE_SIZE = int(os.environ.get('BROADCAST_QUEUE_SIZE', 1000))
+BROADCAST_BATCH_MAX = int(os.environ.get('BROADCAST_BATCH_MAX', 100))
+# Extra wait after the first message of a batch so a steady stream shares frames (0 sends at once)
+BROADCAST_BATCH_MS = float(os.environ.get('BROADCAST_BATCH_MS', 0))
+
+# Frames queued per client; a client that falls this far behind is dropped
+CLIENT_QUEUE_SIZE = int(os.environ.get('CLIENT_QUEUE_SIZE', 64))
+
+# Raw MQTT payloads held for parsing on the event loop; once full the oldest are dropped
+RAW_QUEUE_SIZE = int(os.environ.get('RAW_QUEUE_SIZE', 2048))
+
+# Logging configuration (per-message readings are only logged at DEBUG)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records untouched; the stock prepare() would %-format and copy them on the caller's thread"""
+    def prepare(self, record):
+        # Safe because the listener runs in this process and reads the same record object
+        return record
+
+# Records are only queued by the caller; a listener thread does the formatting and writing
+log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+log_output = logging.StreamHandler()
+log_output.setFormatter(logging.Formatter('[%(asctime)s] %(message)s', datefmt='%H:%M:%S'))
+log_listener = logging.handlers.QueueListener(log_queue, log_output)
+logging.basicConfig(level=LOG_LEVEL, handlers=[DeferredQueueHandler(log_queue)])
+log_listener.start()
+logger = logging.getLogger('websocket_bridge')
+
+# FastAPI app; endpoints that return dicts are encoded with orjson
+app = FastAPI(title="Water Quality WebSocket Bridge", default_response_class=ORJSONResponse)
 
 # Enable CORS
 app.add_middleware(
@@ -39,19 +87,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Store active WebSocket connections
-active_connections: Set[WebSocket] = set()
+# Store active WebSocket connections; replaced, never mutated, so a broadcast can iterate it as-is
+active_connections: Tuple[WebSocket, ...] = ()
 
-# Store latest message and limited history buffer
-latest_message: Optional[Dict[str, Any]] = None
-message_history: Deque[Dict[str, Any]] = deque(maxlen=HISTORY_LIMIT)
+# Each client's outgoing frames and the client_sender task draining them
+client_queues: Dict[WebSocket, Tuple["asyncio.Queue[bytes]", "asyncio.Task[None]"]] = {}
+
+# Store latest message and limited history buffer, each entry already encoded as JSON
+latest_message: Optional[bytes] = None
+message_history: Deque[bytes] = deque(maxlen=HISTORY_LIMIT)
+
+# Encoded history (WebSocket frame and /history body), emptied whenever message_history changes
+history_cache: Dict[str, Any] = {}
 
 # Event loop reference for MQTT bridge
 event_loop: Optional[AbstractEventLoop] = None
 
+# Raw payloads from the MQTT thread (with whether they are zlib-compressed), the event
+# that wakes payload_worker, and its task
+raw_payloads: Deque[Tuple[bytes, bool]] = deque(maxlen=RAW_QUEUE_SIZE)
+raw_ready: Optional[asyncio.Event] = None
+payload_task: Optional["asyncio.Task[None]"] = None
+
+# Messages waiting for broadcast_worker, and the task draining them
+broadcast_queue: Optional["asyncio.Queue[bytes]"] = None
+broadcast_task: Optional["asyncio.Task[None]"] = None
+
+def coerce_float(value: Any) -> Optional[float]:
+    """Return value as a float, or None if it isn't a number"""
+    # JSON numbers arrive as int/float already; only strings and the rest go through try/except
+    if isinstance(value, (float, int)):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
 class MQTTBridge:
     def __init__(self):
         self.mqtt_client = None
+        self.wakeup_pending = False  # payload_worker already has a wakeup scheduled
+        self._last_sec = 0  # Second of the last missing-values report
+        self._missing_unreported = 0  # Incomplete payloads since the last report
         self.setup_mqtt()
     
     def setup_mqtt(self):
@@ -59,11 +136,18 @@ class MQTTBridge:
         self.mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, MQTT_CLIENT_ID)
         self.mqtt_client.on_connect = self.on_connect
         self.mqtt_client.on_message = self.on_message
+        if MQTT_ZLIB_TOPIC:
+            self.mqtt_client.message_callback_add(MQTT_ZLIB_TOPIC, self.on_zlib_message)
         self.mqtt_client.on_disconnect = self.on_disconnect
+        self.mqtt_client.on_connect_fail = self.on_connect_fail
+        # Backoff between attempts when the broker is unreachable or drops the connection
+        self.mqtt_client.reconnect_delay_set(min_delay=1, max_delay=30)
         
         try:
             print(f"Connecting to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}...")
-            self.mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
+            # The loop thread, started once, makes the first attempt and every reconnect,
+            # so a broker that is down at startup is retried too
+            self.mqtt_client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
             self.mqtt_client.loop_start()
         except Exception as e:
             print(f"✗ Error connecting to MQTT broker: {e}")
@@ -72,11 +156,26 @@ class MQTTBridge:
         """Callback when connected to MQTT broker"""
         if reason_code == 0:
             print(f"✓ Connected to MQTT broker")
-            print(f"✓ Subscribing to topic: {MQTT_TOPIC}")
-            client.subscribe(MQTT_TOPIC, qos=1)
+            sock = client.socket()
+            if MQTT_RCVBUF > 0 and sock is not None:
+                # A fixed size switches off the kernel's receive buffer autotuning for this socket
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, MQTT_RCVBUF)
+            topics = [(MQTT_TOPIC, MQTT_QOS)]
+            if MQTT_ZLIB_TOPIC:
+                topics.append((MQTT_ZLIB_TOPIC, MQTT_QOS))
+            print(f"✓ Subscribing to topics: {', '.join(t for t, _ in topics)}")
+            try:
+                client.subscribe(topics)
+            except ValueError as e:
+                # Raised here it would end paho's loop thread, and with it every later reconnect
+                print(f"✗ Error subscribing to MQTT topics: {e}")
         else:
             print(f"✗ Failed to connect, reason code: {reason_code}")
     
+    def on_connect_fail(self, client, userdata):
+        """Callback when a connection attempt fails; paho retries after the backoff delay"""
+        print("✗ Could not reach MQTT broker, retrying...")
+    
     def on_disconnect(self, client, userdata, flags, reason_code, properties):
         """Callback when disconnected from MQTT broker"""
         if reason_code != 0:
@@ -84,18 +183,41 @@ class MQTTBridge:
     
     def on_message(self, client, userdata, msg):
         """Callback when message is received from MQTT"""
-        global latest_message
+        # Only hand the bytes over, so paho's thread gets straight back to the socket;
+        # a wakeup is scheduled only if payload_worker doesn't already have one pending
+        raw_payloads.append((msg.payload, False))
+        self.wake_worker()
+    
+    def on_zlib_message(self, client, userdata, msg):
+        """Callback for compressed batches; payload_worker inflates them"""
+        raw_payloads.append((msg.payload, True))
+        self.wake_worker()
+    
+    def wake_worker(self):
+        """Have payload_worker drain raw_payloads"""
+        if event_loop and not self.wakeup_pending:
+            self.wakeup_pending = True
+            event_loop.call_soon_threadsafe(raw_ready.set)
+    
+    def process_payload(self, payload: bytes):
+        """Parse one MQTT payload and record its readings; returns their JSON, empty if none could be parsed"""
         try:
-            payload = msg.payload.decode('utf-8')
-            data = json.loads(payload)
-            timestamp = data.get('timestamp', datetime.now().isoformat())
-
-            def coerce_float(value: Any) -> Optional[float]:
-                try:
-                    return float(value)
-                except (TypeError, ValueError):
-                    return None
+            data = orjson.loads(payload)  # Parses the raw bytes, no decode step
+        except orjson.JSONDecodeError as e:
+            logger.error("✗ Error parsing message: %s", e)
+            return ()
+        # Batching publishers (PUBLISH_BATCH > 1) send {"samples": [reading, ...]}
+        if isinstance(data, dict) and isinstance(data.get('samples'), list):
+            return [encoded for encoded in map(self.process_reading, data['samples']) if encoded is not None]
+        encoded = self.process_reading(data)
+        return () if encoded is None else (encoded,)
 
+    def process_reading(self, data):
+        """Sanitize one parsed reading and record it; returns its JSON, or None if it can't be processed"""
+        global latest_message
+        try:
+            # Only stamp a time when the publisher didn't (a .get() default is built every call)
+            timestamp = data.get('timestamp') or datetime.now().isoformat()
             turbidity = coerce_float(data.get('turbidity'))
             light_intensity = coerce_float(data.get('light_intensity'))
 
@@ -107,46 +229,147 @@ class MQTTBridge:
             }
 
             if turbidity is not None and light_intensity is not None:
-                print(
-                    f"[{datetime.now().strftime('%H:%M:%S')}] Received: "
-                    f"Turbidity={turbidity:.2f}, Light={light_intensity:.2f}"
+                # Lazy %-formatting: skipped entirely unless LOG_LEVEL=DEBUG
+                logger.debug(
+                    "Received: Turbidity=%.2f, Light=%.2f",
+                    turbidity, light_intensity
                 )
             else:
-                print(
-                    f"[{datetime.now().strftime('%H:%M:%S')}] Received payload with missing values: {sanitized}"
-                )
-
-            message_history.append(sanitized)
-            latest_message = sanitized
+                # Reported at most once per second, so a broken publisher can't flood the log
+                self._missing_unreported += 1
+                sec = int(time.time())
+                if sec != self._last_sec:
+                    self._last_sec = sec
+                    skipped = self._missing_unreported - 1
+                    self._missing_unreported = 0
+                    logger.warning(
+                        "Received payload with missing values: %s%s",
+                        sanitized, f" (+{skipped} more since last report)" if skipped else ""
+                    )
 
-            # Broadcast to all connected WebSocket clients (thread-safe)
-            if event_loop and active_connections:
-                asyncio.run_coroutine_threadsafe(
-                    broadcast_message(json.dumps(sanitized)),
-                    event_loop
-                )
+            # Encoded once here; history and broadcast frames are spliced from these bytes
+            encoded = orjson.dumps(sanitized)
+            message_history.append(encoded)
+            history_cache.clear()
+            latest_message = encoded
+            return encoded
 
-        except json.JSONDecodeError as e:
-            print(f"✗ Error parsing message: {e}")
         except Exception as e:
-            print(f"✗ Error processing message: {e}")
+            logger.error("✗ Error processing message: %s", e)
 
 # Initialize MQTT bridge
 mqtt_bridge = MQTTBridge()
 
-async def broadcast_message(message: str):
-    """Send message to all connected WebSocket clients"""
-    disconnected = set()
+def add_connection(websocket: WebSocket, send_queue: "asyncio.Queue[bytes]", sender: "asyncio.Task[None]"):
+    """Register a dashboard client, its queue and the sender task draining it"""
+    global active_connections
+    client_queues[websocket] = (send_queue, sender)
+    active_connections = active_connections + (websocket,)
+
+def remove_connection(websocket: WebSocket):
+    """Forget a dashboard client; safe to call more than once"""
+    global active_connections
+    active_connections = tuple(c for c in active_connections if c is not websocket)
+    client_queues.pop(websocket, None)
+
+def get_history_frame() -> bytes:
+    """Return the {"type": "history"} frame, encoding it again only if messages arrived since"""
+    frame = history_cache.get("frame")
+    if frame is None:
+        frame = history_cache["frame"] = b'{"type":"history","data":[' + b','.join(message_history) + b']}'
+    return frame
+
+def get_history_body() -> bytes:
+    """Return the /history response body, encoding it again only if messages arrived since"""
+    body = history_cache.get("body")
+    if body is None:
+        body = history_cache["body"] = b'{"data":[%s],"count":%d,"limit":%d}' % (
+            b','.join(message_history), len(message_history), HISTORY_LIMIT
+        )
+    return body
+
+def inflate(payload: bytes) -> Optional[bytes]:
+    """Decompress a zlib batch, or return None if it is corrupt or inflates past MAX_INFLATED_BYTES"""
+    inflater = zlib.decompressobj()
+    try:
+        data = inflater.decompress(payload, MAX_INFLATED_BYTES)
+    except zlib.error as e:
+        logger.error("✗ Error decompressing message: %s", e)
+        return None
+    if inflater.unconsumed_tail:
+        # Stopped at the limit with input left over: a publisher can't make us inflate gigabytes
+        logger.error("✗ Dropping compressed message that inflates past %d bytes", MAX_INFLATED_BYTES)
+        return None
+    return data
+
+async def payload_worker():
+    """Inflate and parse the raw payloads on_message has handed over"""
+    process_payload = mqtt_bridge.process_payload
+    while True:
+        await raw_ready.wait()
+        raw_ready.clear()
+        mqtt_bridge.wakeup_pending = False  # Messages from here on schedule a new wakeup
+        while raw_payloads:
+            payload, compressed = raw_payloads.popleft()
+            if compressed:
+                payload = inflate(payload)
+                if payload is None:
+                    continue
+            for encoded in process_payload(payload):
+                if active_connections:
+                    # Waits while the broadcast queue is full; raw_payloads then drops the oldest
+                    await broadcast_queue.put(encoded)
+
+async def broadcast_worker():
+    """Drain the broadcast queue and send each batch of messages as one frame"""
+    while True:
+        message = await broadcast_queue.get()
+        if BROADCAST_BATCH_MS > 0:
+            await asyncio.sleep(BROADCAST_BATCH_MS / 1000)
+        batch = [message]
+        while len(batch) < BROADCAST_BATCH_MAX and not broadcast_queue.empty():
+            batch.append(broadcast_queue.get_nowait())
+        
+        # A lone message keeps the plain format; several go out as {"type": "batch", "data": [...]}
+        if len(batch) == 1:
+            frame = message
+        else:
+            frame = b'{"type":"batch","data":[' + b','.join(batch) + b']}'
+        if active_connections:
+            broadcast_message(frame)
+
+def broadcast_message(message: bytes):
+    """Queue an encoded message for every connected WebSocket client"""
+    # Never waits on a socket: each client's sender task does its own sends
     for connection in active_connections:
         try:
-            await connection.send_text(message)
-        except Exception as e:
-            print(f"Error sending to client: {e}")
-            disconnected.add(connection)
-    
-    # Remove disconnected clients
-    for connection in disconnected:
-        active_connections.discard(connection)
+            client_queues[connection][0].put_nowait(message)
+        except asyncio.QueueFull:
+            # Telemetry is only useful while fresh: drop a client that stays behind
+            print("⚠ Dropping WebSocket client that is too slow to keep up")
+            drop_client(connection)
+
+def drop_client(websocket: WebSocket):
+    """Stop serving a client; cancelling its sender wakes websocket_endpoint to close it"""
+    entry = client_queues.get(websocket)
+    remove_connection(websocket)
+    if entry is not None:
+        entry[1].cancel()
+
+async def client_sender(websocket: WebSocket, send_queue: "asyncio.Queue[bytes]"):
+    """Send one client its queued frames as binary frames, in order"""
+    try:
+        while True:
+            await websocket.send_bytes(await send_queue.get())
+    except Exception as e:
+        # Remove disconnected clients
+        print(f"Error sending to client: {e}")
+        remove_connection(websocket)
+
+async def client_receiver(websocket: WebSocket):
+    """Read client messages (keep-alives) until the client disconnects"""
+    while True:
+        await websocket.receive_text()
 
 @app.get("/")
 async def root():
@@ -165,59 +388,70 @@ async def root():
 @app.get("/history")
 async def get_history():
     """Return the current buffered history of messages."""
-    return {
-        "data": list(message_history),
-        "count": len(message_history),
-        "limit": HISTORY_LIMIT,
-    }
+    # Pre-encoded body: skips FastAPI's jsonable_encoder and json.dumps on every poll
+    return Response(content=get_history_body(), media_type="application/json")
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for dashboard clients"""
     await websocket.accept()
-    active_connections.add(websocket)
+    
+    # Send historical buffer so clients can render immediately; its last entry is the
+    # latest message, so one frame covers both. Queued first, ahead of any live frame
+    send_queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+    if message_history:
+        send_queue.put_nowait(get_history_frame())
+    elif latest_message:
+        # History disabled (HISTORY_LIMIT=0): send the latest message on its own
+        send_queue.put_nowait(latest_message)
+    sender = asyncio.create_task(client_sender(websocket, send_queue))
+    receiver = asyncio.create_task(client_receiver(websocket))
+    add_connection(websocket, send_queue, sender)
     print(f"✓ New WebSocket client connected. Total: {len(active_connections)}")
     
     try:
-        # Send historical buffer first so clients can render immediately
-        if message_history:
-            history_payload = {
-                "type": "history",
-                "data": list(message_history),
-            }
-            await websocket.send_text(json.dumps(history_payload))
-
-        # Send the latest message (in case clients expect single payload)
-        if latest_message:
-            await websocket.send_text(json.dumps(latest_message))
+        # Ends when the client disconnects, a send fails, or the client is dropped for lagging
+        await asyncio.wait((sender, receiver), return_when=asyncio.FIRST_COMPLETED)
         
-        # Keep connection alive and listen for client messages
-        while True:
-            # Wait for any client message (keep-alive)
+        if sender.cancelled():
+            # Dropped by broadcast_message: tell the client, but don't wait on a stuck socket
             try:
-                data = await websocket.receive_text()
-                # Echo back or handle client messages if needed
-            except WebSocketDisconnect:
-                break
-            
-    except Exception as e:
-        print(f"WebSocket error: {e}")
+                await asyncio.wait_for(websocket.close(code=1013), 1.0)  # 1013: try again later
+            except Exception:
+                pass
+        elif receiver.done() and not receiver.cancelled():
+            error = receiver.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                print(f"WebSocket error: {error}")
     finally:
-        active_connections.discard(websocket)
+        sender.cancel()
+        receiver.cancel()
+        remove_connection(websocket)
         print(f"✗ WebSocket client disconnected. Total: {len(active_connections)}")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
+    if payload_task:
+        payload_task.cancel()
+    if broadcast_task:
+        broadcast_task.cancel()
     if mqtt_bridge.mqtt_client:
         mqtt_bridge.mqtt_client.loop_stop()
         mqtt_bridge.mqtt_client.disconnect()
     print("Shutting down...")
+    log_listener.stop()  # Writes out any queued records
 
 @app.on_event("startup")
 async def startup_event():
-    """Set event loop reference on startup"""
-    global event_loop
+    """Start the payload and broadcast workers, then set the event loop reference"""
+    global event_loop, raw_ready, payload_task, broadcast_queue, broadcast_task
+    raw_ready = asyncio.Event()
+    raw_ready.set()  # Parse anything that arrived before startup
+    broadcast_queue = asyncio.Queue(maxsize=BROADCAST_QUEUE_SIZE)
+    payload_task = asyncio.create_task(payload_worker())
+    broadcast_task = asyncio.create_task(broadcast_worker())
+    # Set last: on_message only schedules wakeups once raw_ready exists
     event_loop = asyncio.get_event_loop()
     print("Event loop initialized for MQTT bridge")
 
@@ -231,4 +465,6 @@ if __name__ == "__main__":
     print("=" * 60)
     print()
     
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # No permessage-deflate: it would compress every frame again for each client, with a
+    # zlib context per connection, for small JSON frames on a local network
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws_per_message_deflate=False)
@@ -13,6 +13,11 @@ type HistoryMessage = {
   data?: unknown;
 };
 
+type BatchMessage = {
+  type: 'batch';
+  data?: unknown;
+};
+
 function deriveHistoryUrl(wsUrl: string): string | null {
   try {
     const url = new URL(wsUrl);
@@ -204,9 +209,13 @@ export function useMQTTWaterQuality() {
       }
     };
 
+    const textDecoder = new TextDecoder();
+
     const connect = () => {
       try {
         const ws = new WebSocket(WS_URL);
+        // The bridge sends binary frames holding UTF-8 JSON
+        ws.binaryType = 'arraybuffer';
         wsRef.current = ws;
 
         ws.onopen = () => {
@@ -220,8 +229,11 @@ export function useMQTTWaterQuality() {
         ws.onmessage = (event) => {
           if (!mounted) return;
           try {
-            const message = JSON.parse(event.data) as
+            const text =
+              typeof event.data === 'string' ? event.data : textDecoder.decode(event.data);
+            const message = JSON.parse(text) as
               | HistoryMessage
+              | BatchMessage
               | Record<string, unknown>;
 
             if (message && typeof message === 'object' && 'type' in message) {
@@ -236,6 +248,17 @@ export function useMQTTWaterQuality() {
                 } else {
                   historyFetchStateRef.current = 'done';
                 }
+              } else if (message.type === 'batch' && Array.isArray(message.data)) {
+                // Several live readings the bridge coalesced into one frame
+                const normalized = (message.data as unknown[])
+                  .map(normalizeWaterQualityData)
+                  .filter(
+                    (item: WaterQualityData | null): item is WaterQualityData => item !== null,
+                  );
+                if (normalized.length) {
+                  setLatestData(normalized[normalized.length - 1]);
+                  setHistoricalData((prev) => mergeByTimestamp(prev, normalized));
+                }
               }
               return;
             }